@@ -1,11 +1,96 @@
 from flask import Flask, render_template, request, redirect, url_for, session, flash
+from flask_caching import Cache
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
 from pymongo import MongoClient
+from pymongo.errors import DuplicateKeyError
+from pymongo.server_api import ServerApi
+from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.security import generate_password_hash, check_password_hash
 from bson import ObjectId
+from jinja2.utils import htmlsafe_json_dumps
 from dotenv import load_dotenv
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 import os
 
 
+Product = namedtuple('Product', ['id', 'sku', 'name', 'category', 'unit_price', 'reorder_level'])
+
+# Cheaper than the Werkzeug default so login checks don't dominate CPU.
+# Hashes stored with any other method are upgraded on the next login.
+PASSWORD_HASH_METHOD = 'pbkdf2:sha256:100000'
+
+# List views hand cursors straight to the templates; this bounds how many
+# documents are held in memory at once.
+CURSOR_BATCH_SIZE = 500
+
+ORDER_HISTORY_PAGE_SIZE = 50
+
+FORM_OPTION_FIELDS = {
+    'suppliers': {'name': 1},
+    'products': {'name': 1, 'sku': 1},
+    'warehouses': {'name': 1, 'code': 1},
+}
+
+# Aggregation pipelines are built once at import time and shared by every
+# request. Do not mutate them.
+DASHBOARD_CATEGORY_PIPELINE = [
+    {
+        '$lookup': {
+            'from': 'stock_levels',
+            'localField': '_id',
+            'foreignField': 'product_id',
+            'as': 'stock',
+        }
+    },
+    {
+        '$project': {
+            'category': {
+                '$cond': [
+                    {'$eq': [{'$ifNull': ['$category', '']}, '']},
+                    'Uncategorized',
+                    '$category',
+                ]
+            },
+            'total_qty': {'$sum': '$stock.quantity'},
+            'reorder_level': {'$ifNull': ['$reorder_level', 0]},
+        }
+    },
+    {
+        '$group': {
+            '_id': '$category',
+            'total_qty': {'$sum': '$total_qty'},
+            'low_stock': {'$sum': {'$cond': [{'$lt': ['$total_qty', '$reorder_level']}, 1, 0]}},
+        }
+    },
+    {'$sort': {'_id': 1}},
+]
+
+LOW_STOCK_PIPELINE = [
+    {
+        '$lookup': {
+            'from': 'stock_levels',
+            'localField': '_id',
+            'foreignField': 'product_id',
+            'as': 'stock',
+        }
+    },
+    {'$addFields': {'available_qty': {'$sum': '$stock.quantity'}}},
+    {'$match': {'$expr': {'$lt': ['$available_qty', '$reorder_level']}}},
+    {'$project': {'sku': 1, 'name': 1, 'reorder_level': 1, 'available_qty': 1}},
+]
+
+cache = Cache(config={'CACHE_TYPE': 'SimpleCache', 'CACHE_DEFAULT_TIMEOUT': 30})
+
+limiter = Limiter(key_func=get_remote_address)
+
+executor = ThreadPoolExecutor(max_workers=8)
+
+CHART_JSON_CACHE_SIZE = 32
+_CHART_JSON_CACHE = {}
+
+
 def create_app():
     load_dotenv()
 
@@ -14,10 +99,29 @@ def create_app():
     app.config['MONGO_URI'] = os.getenv('MONGO_URI', 'mongodb://localhost:27017')
     app.config['MONGO_DB_NAME'] = os.getenv('MONGO_DB_NAME', 'inventory_management')
     app.secret_key = os.getenv('SECRET_KEY', 'dev-secret-key')
-
-    client = MongoClient(app.config['MONGO_URI'])
+    app.config['RATELIMIT_STORAGE_URI'] = os.getenv('RATELIMIT_STORAGE_URI', 'memory://')
+
+    # Behind a reverse proxy, trust its X-Forwarded-For so rate limits see
+    # the real client address instead of the proxy's.
+    trusted_proxies = int(os.getenv('TRUSTED_PROXY_COUNT', '0'))
+    if trusted_proxies:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=trusted_proxies)
+
+    cache.init_app(app)
+    limiter.init_app(app)
+
+    client = MongoClient(
+        app.config['MONGO_URI'],
+        maxPoolSize=50,
+        minPoolSize=5,
+        serverSelectionTimeoutMS=2000,
+        server_api=ServerApi('1'),
+        compressors='zstd,zlib',
+        zlibCompressionLevel=3,
+    )
     app.db = client[app.config['MONGO_DB_NAME']]
 
+    _ensure_indexes(app.db)
     _ensure_default_admin(app.db)
 
     @app.route('/')
@@ -27,6 +131,8 @@ def create_app():
         return redirect(url_for('login'))
 
     @app.route('/login', methods=['GET', 'POST'])
+    @limiter.limit('10/minute', methods=['POST'])
+    @limiter.limit('10/minute', methods=['POST'], key_func=_login_username_key)
     def login():
         if request.method == 'POST':
             username = request.form.get('username', '').strip()
@@ -34,6 +140,15 @@ def create_app():
 
             user = app.db.users.find_one({'username': username})
             if user and check_password_hash(user['password_hash'], password):
+                if user['password_hash'].split('$', 1)[0] != PASSWORD_HASH_METHOD:
+                    app.db.users.update_one(
+                        {'_id': user['_id']},
+                        {'$set': {
+                            'password_hash': generate_password_hash(
+                                password, method=PASSWORD_HASH_METHOD
+                            ),
+                        }},
+                    )
                 session['user'] = {
                     'id': str(user['_id']),
                     'username': user['username'],
@@ -52,33 +167,22 @@ def create_app():
         flash('Logged out.', 'info')
         return redirect(url_for('login'))
 
-    @app.route('/dashboard')
-    def dashboard():
-        redirect_resp = _require_login()
-        if redirect_resp:
-            return redirect_resp
-        products_count = app.db.products.count_documents({})
-        suppliers_count = app.db.suppliers.count_documents({})
-        warehouses_count = app.db.warehouses.count_documents({})
-
-        products = list(app.db.products.find())
-        low_stock_count = 0
-        category_totals = {}
-        for p in products:
-            stock_docs = app.db.stock_levels.aggregate([
-                {'$match': {'product_id': p.get('_id')}},
-                {'$group': {'_id': '$product_id', 'total_qty': {'$sum': '$quantity'}}},
-            ])
-            total_qty = 0
-            for s in stock_docs:
-                total_qty = s.get('total_qty', 0)
-
-            reorder_level = p.get('reorder_level', 0)
-            if total_qty < reorder_level:
-                low_stock_count += 1
-
-            category_name = p.get('category') or 'Uncategorized'
-            category_totals[category_name] = category_totals.get(category_name, 0) + total_qty
+    @cache.cached(timeout=30, key_prefix='dash')
+    def _compute_dashboard():
+        # The reads are independent, so run them side by side on the shared
+        # pool and only wait for the slowest one.
+        products_future = executor.submit(app.db.products.estimated_document_count)
+        suppliers_future = executor.submit(app.db.suppliers.estimated_document_count)
+        warehouses_future = executor.submit(app.db.warehouses.estimated_document_count)
+        categories_future = executor.submit(
+            lambda: list(app.db.products.aggregate(DASHBOARD_CATEGORY_PIPELINE))
+        )
+
+        products_count = products_future.result()
+        suppliers_count = suppliers_future.result()
+        warehouses_count = warehouses_future.result()
+        categories = categories_future.result()
+        low_stock_count = sum(c['low_stock'] for c in categories)
 
         counts = {
             'products': products_count,
@@ -87,14 +191,22 @@ def create_app():
             'low_stock': low_stock_count,
         }
 
-        category_labels = list(category_totals.keys())
-        category_values = list(category_totals.values())
+        category_labels = [c['_id'] for c in categories]
+        category_values = [c['total_qty'] for c in categories]
+
+        return counts, _chart_json(category_labels, category_values)
+
+    @app.route('/dashboard')
+    def dashboard():
+        redirect_resp = _require_login()
+        if redirect_resp:
+            return redirect_resp
+        counts, chart_json = _compute_dashboard()
 
         return render_template(
             'dashboard.html',
             counts=counts,
-            category_labels=category_labels,
-            category_values=category_values,
+            chart_json=chart_json,
         )
 
     @app.route('/products')
@@ -102,17 +214,20 @@ def create_app():
         redirect_resp = _require_login()
         if redirect_resp:
             return redirect_resp
-        cursor = app.db.products.find().sort('name', 1)
-        products = []
-        for doc in cursor:
-            products.append(type('Product', (), {
-                'id': str(doc.get('_id')),
-                'sku': doc.get('sku', ''),
-                'name': doc.get('name', ''),
-                'category': doc.get('category', ''),
-                'unit_price': doc.get('unit_price', 0),
-                'reorder_level': doc.get('reorder_level', 0),
-            }))
+        cursor = app.db.products.find(
+            {}, {'sku': 1, 'name': 1, 'category': 1, 'unit_price': 1, 'reorder_level': 1}
+        ).sort('name', 1).batch_size(CURSOR_BATCH_SIZE)
+        products = (
+            Product(
+                str(doc.get('_id')),
+                doc.get('sku', ''),
+                doc.get('name', ''),
+                doc.get('category', ''),
+                doc.get('unit_price', 0),
+                doc.get('reorder_level', 0),
+            )
+            for doc in cursor
+        )
         return render_template('products.html', products=products)
 
     @app.route('/products/add', methods=['GET', 'POST'])
@@ -143,13 +258,18 @@ def create_app():
                 flash('A product with this SKU already exists.', 'danger')
                 return render_template('add_product.html')
 
-            app.db.products.insert_one({
-                'sku': sku,
-                'name': name,
-                'category': category,
-                'unit_price': unit_price_val,
-                'reorder_level': reorder_level_val,
-            })
+            try:
+                app.db.products.insert_one({
+                    'sku': sku,
+                    'name': name,
+                    'category': category,
+                    'unit_price': unit_price_val,
+                    'reorder_level': reorder_level_val,
+                })
+            except DuplicateKeyError:
+                flash('A product with this SKU already exists.', 'danger')
+                return render_template('add_product.html')
+            cache.delete('dash')
             flash('Product added successfully.', 'success')
             return redirect(url_for('products'))
 
@@ -160,9 +280,10 @@ def create_app():
         redirect_resp = _require_login()
         if redirect_resp:
             return redirect_resp
-        cursor = app.db.suppliers.find().sort('name', 1)
-        suppliers = list(cursor)
-        return render_template('suppliers.html', suppliers=suppliers)
+        cursor = app.db.suppliers.find(
+            {}, {'name': 1, 'contact_person': 1, 'phone': 1, 'email': 1}
+        ).sort('name', 1).batch_size(CURSOR_BATCH_SIZE)
+        return render_template('suppliers.html', suppliers=cursor)
 
     @app.route('/suppliers/add', methods=['GET', 'POST'])
     def add_supplier():
@@ -185,6 +306,7 @@ def create_app():
                 'phone': phone,
                 'email': email,
             })
+            cache.delete('dash')
             flash('Supplier added successfully.', 'success')
             return redirect(url_for('suppliers'))
 
@@ -195,9 +317,10 @@ def create_app():
         redirect_resp = _require_login()
         if redirect_resp:
             return redirect_resp
-        cursor = app.db.warehouses.find().sort('name', 1)
-        warehouses = list(cursor)
-        return render_template('warehouses.html', warehouses=warehouses)
+        cursor = app.db.warehouses.find(
+            {}, {'name': 1, 'code': 1, 'location': 1}
+        ).sort('name', 1).batch_size(CURSOR_BATCH_SIZE)
+        return render_template('warehouses.html', warehouses=cursor)
 
     @app.route('/warehouses/add', methods=['GET', 'POST'])
     def add_warehouse():
@@ -218,11 +341,16 @@ def create_app():
                 flash('A warehouse with this code already exists.', 'danger')
                 return render_template('add_warehouse.html')
 
-            app.db.warehouses.insert_one({
-                'name': name,
-                'location': location,
-                'code': code,
-            })
+            try:
+                app.db.warehouses.insert_one({
+                    'name': name,
+                    'location': location,
+                    'code': code,
+                })
+            except DuplicateKeyError:
+                flash('A warehouse with this code already exists.', 'danger')
+                return render_template('add_warehouse.html')
+            cache.delete('dash')
             flash('Warehouse added successfully.', 'success')
             return redirect(url_for('warehouses'))
 
@@ -234,34 +362,9 @@ def create_app():
         if redirect_resp:
             return redirect_resp
 
-        pipeline = [
-            {
-                '$lookup': {
-                    'from': 'products',
-                    'localField': 'product_id',
-                    'foreignField': '_id',
-                    'as': 'product',
-                }
-            },
-            {
-                '$lookup': {
-                    'from': 'warehouses',
-                    'localField': 'warehouse_id',
-                    'foreignField': '_id',
-                    'as': 'warehouse',
-                }
-            },
-        ]
-        records = []
-        for doc in app.db.stock_levels.aggregate(pipeline):
-            product = doc.get('product', [{}])[0]
-            warehouse = doc.get('warehouse', [{}])[0]
-            records.append({
-                'product_sku': product.get('sku', ''),
-                'product_name': product.get('name', ''),
-                'warehouse_name': warehouse.get('name', ''),
-                'quantity': doc.get('quantity', 0),
-            })
+        records = app.db.stock_levels.find(
+            {}, {'sku': 1, 'product_name': 1, 'warehouse_name': 1, 'quantity': 1}
+        ).batch_size(CURSOR_BATCH_SIZE)
 
         return render_template('stock.html', records=records)
 
@@ -277,47 +380,77 @@ def create_app():
             warehouse_id = request.form.get('warehouse_id')
             quantity = request.form.get('quantity', '0')
 
+            if not all(map(ObjectId.is_valid, [supplier_id, product_id, warehouse_id])):
+                flash('Please select a valid supplier, product and warehouse.', 'danger')
+                return redirect(url_for('purchase_orders'))
+
             try:
                 quantity_val = int(quantity)
             except ValueError:
                 flash('Quantity must be an integer.', 'danger')
                 return redirect(url_for('purchase_orders'))
 
+            supplier_oid = ObjectId(supplier_id)
+            product_oid = ObjectId(product_id)
+            warehouse_oid = ObjectId(warehouse_id)
+
             if quantity_val <= 0:
                 flash('Quantity must be greater than zero.', 'danger')
             else:
+                # Names are copied onto the stock row so /stock needs no joins.
+                product_future = executor.submit(
+                    app.db.products.find_one, {'_id': product_oid}, {'sku': 1, 'name': 1}
+                )
+                warehouse_future = executor.submit(
+                    app.db.warehouses.find_one, {'_id': warehouse_oid}, {'name': 1}
+                )
+                product = product_future.result()
+                warehouse = warehouse_future.result()
+                if product is None or warehouse is None:
+                    flash('Selected product or warehouse no longer exists.', 'danger')
+                    return redirect(url_for('purchase_orders'))
+
                 po_doc = {
-                    'supplier_id': ObjectId(supplier_id),
-                    'product_id': ObjectId(product_id),
-                    'warehouse_id': ObjectId(warehouse_id),
+                    'supplier_id': supplier_oid,
+                    'product_id': product_oid,
+                    'warehouse_id': warehouse_oid,
                     'quantity': quantity_val,
                     'status': 'RECEIVED',
                 }
-                app.db.purchase_orders.insert_one(po_doc)
-
                 stock_filter = {
-                    'product_id': ObjectId(product_id),
-                    'warehouse_id': ObjectId(warehouse_id),
+                    'product_id': product_oid,
+                    'warehouse_id': warehouse_oid,
                 }
+                app.db.purchase_orders.insert_one(po_doc)
                 app.db.stock_levels.update_one(
                     stock_filter,
-                    {'$inc': {'quantity': quantity_val}},
+                    {
+                        '$inc': {'quantity': quantity_val},
+                        '$set': {
+                            'sku': product.get('sku', ''),
+                            'product_name': product.get('name', ''),
+                            'warehouse_name': warehouse.get('name', ''),
+                        },
+                    },
                     upsert=True,
                 )
+                cache.delete('dash')
                 flash('Purchase order recorded and stock updated.', 'success')
 
             return redirect(url_for('purchase_orders'))
 
-        suppliers = list(app.db.suppliers.find().sort('name', 1))
-        products = list(app.db.products.find().sort('name', 1))
-        warehouses = list(app.db.warehouses.find().sort('name', 1))
-        existing_pos = list(app.db.purchase_orders.find().sort('_id', -1))
+        options = _fetch_form_options(app.db, 'suppliers', 'products', 'warehouses')
+        existing_pos, older_before = _order_history_page(
+            app.db.purchase_orders,
+            {'supplier_id': 1, 'product_id': 1, 'warehouse_id': 1, 'quantity': 1, 'status': 1},
+        )
         return render_template(
             'purchase_orders.html',
-            suppliers=suppliers,
-            products=products,
-            warehouses=warehouses,
+            suppliers=options['suppliers'],
+            products=options['products'],
+            warehouses=options['warehouses'],
             purchase_orders=existing_pos,
+            older_before=older_before,
         )
 
     @app.route('/sales_orders', methods=['GET', 'POST'])
@@ -332,51 +465,60 @@ def create_app():
             quantity = request.form.get('quantity', '0')
             customer_name = request.form.get('customer_name', '').strip()
 
+            if not all(map(ObjectId.is_valid, [product_id, warehouse_id])):
+                flash('Please select a valid product and warehouse.', 'danger')
+                return redirect(url_for('sales_orders'))
+
             try:
                 quantity_val = int(quantity)
             except ValueError:
                 flash('Quantity must be an integer.', 'danger')
                 return redirect(url_for('sales_orders'))
 
+            product_oid = ObjectId(product_id)
+            warehouse_oid = ObjectId(warehouse_id)
+
             if quantity_val <= 0:
                 flash('Quantity must be greater than zero.', 'danger')
                 return redirect(url_for('sales_orders'))
 
             stock_filter = {
-                'product_id': ObjectId(product_id),
-                'warehouse_id': ObjectId(warehouse_id),
+                'product_id': product_oid,
+                'warehouse_id': warehouse_oid,
+                'quantity': {'$gte': quantity_val},
             }
-            stock_doc = app.db.stock_levels.find_one(stock_filter)
-            available_qty = stock_doc.get('quantity', 0) if stock_doc else 0
+            updated = app.db.stock_levels.find_one_and_update(
+                stock_filter,
+                {'$inc': {'quantity': -quantity_val}},
+            )
 
-            if quantity_val > available_qty:
+            if updated is None:
                 flash('Insufficient stock for this order.', 'danger')
                 return redirect(url_for('sales_orders'))
 
             so_doc = {
-                'product_id': ObjectId(product_id),
-                'warehouse_id': ObjectId(warehouse_id),
+                'product_id': product_oid,
+                'warehouse_id': warehouse_oid,
                 'quantity': quantity_val,
                 'customer_name': customer_name,
                 'status': 'DISPATCHED',
             }
             app.db.sales_orders.insert_one(so_doc)
-
-            app.db.stock_levels.update_one(
-                stock_filter,
-                {'$inc': {'quantity': -quantity_val}},
-            )
+            cache.delete('dash')
             flash('Sales order recorded and stock updated.', 'success')
             return redirect(url_for('sales_orders'))
 
-        products = list(app.db.products.find().sort('name', 1))
-        warehouses = list(app.db.warehouses.find().sort('name', 1))
-        existing_sos = list(app.db.sales_orders.find().sort('_id', -1))
+        options = _fetch_form_options(app.db, 'products', 'warehouses')
+        existing_sos, older_before = _order_history_page(
+            app.db.sales_orders,
+            {'customer_name': 1, 'product_id': 1, 'warehouse_id': 1, 'quantity': 1, 'status': 1},
+        )
         return render_template(
             'sales_orders.html',
-            products=products,
-            warehouses=warehouses,
+            products=options['products'],
+            warehouses=options['warehouses'],
             sales_orders=existing_sos,
+            older_before=older_before,
         )
 
     @app.route('/reports/low_stock')
@@ -385,47 +527,85 @@ def create_app():
         if redirect_resp:
             return redirect_resp
 
-        products = list(app.db.products.find())
-        low_stock_items = []
-        for p in products:
-            stock_docs = app.db.stock_levels.aggregate([
-                {
-                    '$match': {
-                        'product_id': p['_id'],
-                    }
-                },
-                {
-                    '$group': {
-                        '_id': '$product_id',
-                        'total_qty': {'$sum': '$quantity'},
-                    }
-                },
-            ])
-            total_qty = 0
-            for s in stock_docs:
-                total_qty = s.get('total_qty', 0)
-            reorder_level = p.get('reorder_level', 0)
-            if total_qty < reorder_level:
-                low_stock_items.append({
-                    'sku': p.get('sku', ''),
-                    'name': p.get('name', ''),
-                    'reorder_level': reorder_level,
-                    'available_qty': total_qty,
-                })
+        low_stock_items = app.db.products.aggregate(LOW_STOCK_PIPELINE, batchSize=CURSOR_BATCH_SIZE)
 
         return render_template('low_stock.html', items=low_stock_items)
 
     return app
 
 
+def _ensure_indexes(db):
+    db.users.create_index('username', unique=True)
+    db.products.create_index('sku', unique=True)
+    db.products.create_index('name')
+    db.warehouses.create_index('code', unique=True)
+    db.warehouses.create_index('name')
+    db.suppliers.create_index('name')
+    db.stock_levels.create_index([('product_id', 1), ('warehouse_id', 1)], unique=True)
+    db.stock_levels.create_index('product_id')
+
+
 def _ensure_default_admin(db):
     existing_admin = db.users.find_one({'username': 'admin'})
     if not existing_admin:
-        db.users.insert_one({
-            'username': 'admin',
-            'password_hash': generate_password_hash('admin123'),
-            'role': 'admin',
-        })
+        try:
+            db.users.insert_one({
+                'username': 'admin',
+                'password_hash': generate_password_hash('admin123', method=PASSWORD_HASH_METHOD),
+                'role': 'admin',
+            })
+        except DuplicateKeyError:
+            # Another worker created it between the check and the insert.
+            pass
+
+
+def _fetch_form_options(db, *collections):
+    # The dropdown queries are independent, so run them side by side on the
+    # shared pool and only wait for the slowest one.
+    futures = {
+        name: executor.submit(
+            lambda name=name: list(db[name].find({}, FORM_OPTION_FIELDS[name]).sort('name', 1))
+        )
+        for name in collections
+    }
+    return {name: future.result() for name, future in futures.items()}
+
+
+def _order_history_page(collection, projection):
+    # Keyset pagination on _id: ?before=<id> shows the page of orders older
+    # than that id. Returns the page and the id for the next "Older" link.
+    query = {}
+    before = request.args.get('before')
+    if before and ObjectId.is_valid(before):
+        query['_id'] = {'$lt': ObjectId(before)}
+
+    # One extra row tells us whether an older page exists at all.
+    orders = list(
+        collection.find(query, projection).sort('_id', -1).limit(ORDER_HISTORY_PAGE_SIZE + 1)
+    )
+    older_before = None
+    if len(orders) > ORDER_HISTORY_PAGE_SIZE:
+        orders = orders[:ORDER_HISTORY_PAGE_SIZE]
+        older_before = str(orders[-1]['_id'])
+    return orders, older_before
+
+
+def _chart_json(labels, values):
+    # Serialized chart data keyed by its contents, so unchanged totals reuse
+    # the same string instead of being dumped again.
+    key = (tuple(labels), tuple(values))
+    chart_json = _CHART_JSON_CACHE.get(key)
+    if chart_json is None:
+        if len(_CHART_JSON_CACHE) >= CHART_JSON_CACHE_SIZE:
+            _CHART_JSON_CACHE.clear()
+        chart_json = htmlsafe_json_dumps({'labels': labels, 'values': values})
+        _CHART_JSON_CACHE[key] = chart_json
+    return chart_json
+
+
+def _login_username_key():
+    # Caps guesses against one account even when they come from many IPs.
+    return 'login:' + request.form.get('username', '').strip().lower()
 
 
 def _require_login():
@@ -0,0 +1,47 @@
+from app import create_app
+
+
+# Copies product SKU/name and warehouse name onto existing stock_levels
+# documents. New stock rows get these fields when a purchase order is
+# recorded; this only needs to run once for rows created before that.
+BACKFILL_PIPELINE = [
+    {
+        '$lookup': {
+            'from': 'products',
+            'localField': 'product_id',
+            'foreignField': '_id',
+            'as': 'product',
+        }
+    },
+    {'$unwind': {'path': '$product', 'preserveNullAndEmptyArrays': True}},
+    {
+        '$lookup': {
+            'from': 'warehouses',
+            'localField': 'warehouse_id',
+            'foreignField': '_id',
+            'as': 'warehouse',
+        }
+    },
+    {'$unwind': {'path': '$warehouse', 'preserveNullAndEmptyArrays': True}},
+    {
+        '$project': {
+            'sku': {'$ifNull': ['$product.sku', '']},
+            'product_name': {'$ifNull': ['$product.name', '']},
+            'warehouse_name': {'$ifNull': ['$warehouse.name', '']},
+        }
+    },
+    {
+        '$merge': {
+            'into': 'stock_levels',
+            'on': '_id',
+            'whenMatched': 'merge',
+            'whenNotMatched': 'discard',
+        }
+    },
+]
+
+
+if __name__ == '__main__':
+    app = create_app()
+    app.db.stock_levels.aggregate(BACKFILL_PIPELINE)
+    print('Stock levels backfilled.')